@@ -1,108 +1,360 @@
 import discord
 from discord.ext import commands
-import sqlite3
-from datetime import datetime
+from aiohttp import web
+import aiosqlite
+import asyncio
+import signal
+import time
 import os
 
 # Bot setup
 intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix='!', intents=intents)
+bot.money_channel_ids = frozenset()
 
 # Constants
 MONEY_PER_MESSAGE = 5
+FLUSH_INTERVAL = 0.5    # seconds between batched credit flushes
+FLUSH_BATCH_LIMIT = 200  # flush early once this many credits are queued
+USER_CACHE_LIMIT = 10000  # max wallets kept in the in-memory cache
+
+# Optional earning cap per UTC day; unset or 0 means unlimited. Both
+# behaviors share one code path instead of diverging copies of the bot.
+DAILY_LIMIT = int(os.getenv('DAILY_LIMIT', 0)) or None
+
+def current_day():
+    """Current UTC day as an integer bucket (no strftime needed)"""
+    return int(time.time() // 86400)
+
+# SQL kept as module constants: sqlite3's statement cache is keyed by
+# the SQL string, so always passing the same interned object guarantees
+# a prepared-statement hit instead of a re-parse.
+SQL_SELECT_WALLET = 'SELECT wallet_money FROM users WHERE user_id = ?'
+SQL_INSERT_USER = 'INSERT OR IGNORE INTO users (user_id, wallet_money) VALUES (?, 0)'
+if DAILY_LIMIT is None:
+    SQL_CREDIT_UPSERT = '''
+        INSERT INTO users (user_id, wallet_money)
+        VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE
+        SET wallet_money = wallet_money + excluded.wallet_money
+    '''
+else:
+    # The cap lives entirely in SQL: the day rollover resets
+    # daily_earned lazily and the WHERE clause turns capped credits
+    # into no-ops, so the hot path needs no Python-side branch.
+    SQL_CREDIT_UPSERT = f'''
+        INSERT INTO users (user_id, wallet_money, daily_earned, last_earn_day)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            wallet_money = wallet_money + excluded.wallet_money,
+            daily_earned = CASE WHEN last_earn_day = excluded.last_earn_day
+                                THEN daily_earned ELSE 0
+                           END + excluded.wallet_money,
+            last_earn_day = excluded.last_earn_day
+        WHERE last_earn_day <> excluded.last_earn_day
+           OR daily_earned < {DAILY_LIMIT}
+    '''
 
 class MoneyBot:
     def __init__(self):
-        self.init_database()
-    
-    def init_database(self):
+        self.conn = None
+        self._pending = []
+        self._flush_task = None
+        self._db_lock = None
+        # user_id -> wallet_money; chat activity is power-law, so a
+        # bounded dict absorbs most balance reads without touching SQLite.
+        self._wallet_cache = {}
+
+    async def start(self):
+        """Connect and prepare the database on the bot's loop (idempotent).
+
+        One connection for the whole process: SQLite's page cache is
+        per-connection, so reusing it keeps hot pages warm instead of
+        paying an open/close cycle on every message. aiosqlite runs the
+        connection on its own worker thread, so nothing here blocks the
+        Discord gateway heartbeat.
+        """
+        if self.conn is not None:
+            return
+        self.conn = await aiosqlite.connect('money_bot.db',
+                                            cached_statements=256)
+        self._db_lock = asyncio.Lock()
+        await self.tune_database()
+        await self.init_database()
+        self.start_flushing()
+
+    async def tune_database(self):
+        """Apply once-per-connection PRAGMA tuning.
+
+        WAL turns the per-message UPDATE into a sequential log append and
+        lets reads run concurrently with writes; synchronous=NORMAL drops
+        the per-commit fsync, which is an acceptable trade for game money.
+        """
+        await self.conn.execute('PRAGMA journal_mode=WAL')
+        await self.conn.execute('PRAGMA synchronous=NORMAL')
+        await self.conn.execute('PRAGMA temp_store=MEMORY')
+        await self.conn.execute('PRAGMA cache_size=-64000')
+        await self.conn.execute('PRAGMA busy_timeout=5000')
+
+    async def init_database(self):
         """Initialize the SQLite database"""
-        conn = sqlite3.connect('money_bot.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        # Migrate databases created before the WITHOUT ROWID layout:
+        # rebuild the table once so point lookups skip the rowid
+        # indirection and rows pack tighter per page.
+        cursor = await self.conn.execute('''
+            SELECT sql FROM sqlite_master
+            WHERE type = 'table' AND name = 'users'
+        ''')
+        existing = await cursor.fetchone()
+        if existing and 'WITHOUT ROWID' not in existing[0]:
+            await self.conn.executescript('''
+                BEGIN;
+                CREATE TABLE users_new (
+                    user_id INTEGER PRIMARY KEY,
+                    wallet_money INTEGER DEFAULT 0
+                ) WITHOUT ROWID;
+                INSERT INTO users_new SELECT user_id, wallet_money FROM users;
+                DROP TABLE users;
+                ALTER TABLE users_new RENAME TO users;
+                COMMIT;
+            ''')
+
+        await self.conn.execute('''
             CREATE TABLE IF NOT EXISTS users (
                 user_id INTEGER PRIMARY KEY,
-                wallet_money INTEGER DEFAULT 0
-            )
+                wallet_money INTEGER DEFAULT 0,
+                daily_earned INTEGER DEFAULT 0,
+                last_earn_day INTEGER DEFAULT 0
+            ) WITHOUT ROWID
         ''')
-        
-        conn.commit()
-        conn.close()
-    
-    def get_user_data(self, user_id):
-        """Get user's money data from database"""
-        conn = sqlite3.connect('money_bot.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-        result = cursor.fetchone()
-        
-        if not result:
-            # Create new user
-            cursor.execute('''
-                INSERT INTO users (user_id, wallet_money)
-                VALUES (?, 0)
-            ''', (user_id,))
-            conn.commit()
-            result = (user_id, 0)
-        
-        conn.close()
-        return result
-    
-    def update_user_data(self, user_id, wallet=None):
-        """Update user's money data"""
-        conn = sqlite3.connect('money_bot.db')
-        cursor = conn.cursor()
-        
-        # Get current data first
-        current = self.get_user_data(user_id)
-        
-        # Use provided values or keep current ones
-        new_wallet = wallet if wallet is not None else current[1]
-        
-        cursor.execute('''
-            UPDATE users 
-            SET wallet_money = ?
-            WHERE user_id = ?
-        ''', (new_wallet, user_id))
-        
-        conn.commit()
-        conn.close()
-    
+
+        # Databases from before the daily-limit columns existed just
+        # grow them in place; defaults make old rows valid as-is.
+        cursor = await self.conn.execute('PRAGMA table_info(users)')
+        columns = {row[1] for row in await cursor.fetchall()}
+        for column in ('daily_earned', 'last_earn_day'):
+            if column not in columns:
+                await self.conn.execute(
+                    f'ALTER TABLE users ADD COLUMN {column} INTEGER DEFAULT 0')
+
+        await self.conn.commit()
+
+    async def get_user_data(self, user_id):
+        """Get user's wallet balance, preferring the in-memory cache"""
+        wallet = self._wallet_cache.get(user_id)
+        if wallet is not None:
+            return wallet
+
+        # The whole read-and-cache runs under _db_lock so it can't
+        # interleave with a flush, whose commit and cache bumps happen
+        # inside the same lock; otherwise a read could cache a pre-flush
+        # wallet that the bump loop never corrects (or double-counts).
+        # Credits still queued in _pending are fine: their flush runs
+        # after this caches and bumps the entry we store here.
+        async with self._db_lock:
+            # Project only wallet_money: the caller already has user_id,
+            # so there's no point paying the row-conversion cost for it.
+            cursor = await self.conn.execute(SQL_SELECT_WALLET, (user_id,))
+            result = await cursor.fetchone()
+
+            if result:
+                wallet = result[0]
+            else:
+                # Create new user. Insert OR IGNORE and read back the
+                # row that won in case one already appeared, rather
+                # than assuming zero.
+                cursor = await self.conn.execute(SQL_INSERT_USER, (user_id,))
+                await self.conn.commit()
+                if cursor.rowcount == 0:
+                    cursor = await self.conn.execute(SQL_SELECT_WALLET,
+                                                     (user_id,))
+                    result = await cursor.fetchone()
+                    wallet = result[0] if result else 0
+                else:
+                    wallet = 0
+
+            self._cache_wallet(user_id, wallet)
+        return wallet
+
+    def _cache_wallet(self, user_id, wallet):
+        """Remember a wallet value, evicting the oldest entry when full"""
+        self._wallet_cache[user_id] = wallet
+        if len(self._wallet_cache) > USER_CACHE_LIMIT:
+            self._wallet_cache.pop(next(iter(self._wallet_cache)))
+
     def add_money(self, user_id):
-        """Add money to user's wallet"""
-        user_data = self.get_user_data(user_id)
-        new_wallet = user_data[1] + MONEY_PER_MESSAGE
-        self.update_user_data(user_id, wallet=new_wallet)
+        """Queue a per-message credit for the next batched flush"""
+        self._pending.append(user_id)
+        if len(self._pending) >= FLUSH_BATCH_LIMIT and self.conn is not None:
+            asyncio.create_task(self.flush_pending())
         return True
 
+    async def flush_pending(self):
+        """Write all queued credits in one transaction.
+
+        SQLite throughput is bounded by transactions per second, not
+        statements per second, so committing a whole batch at once cuts
+        fsyncs by the batch size.
+        """
+        async with self._db_lock:
+            batch = self._pending
+            self._pending = []
+            if not batch:
+                return
+            if DAILY_LIMIT is None:
+                rows = [(user_id, MONEY_PER_MESSAGE) for user_id in batch]
+            else:
+                day = current_day()
+                rows = [(user_id, MONEY_PER_MESSAGE, MONEY_PER_MESSAGE, day)
+                        for user_id in batch]
+            await self.conn.execute('BEGIN IMMEDIATE')
+            await self.conn.executemany(SQL_CREDIT_UPSERT, rows)
+            await self.conn.commit()
+            # Keep already-cached wallets coherent with the credits we
+            # just wrote; uncached users are loaded on their next read.
+            # With a daily cap a credit may have been a no-op, so we
+            # can't just bump the cached value - drop it instead.
+            for user_id in batch:
+                if DAILY_LIMIT is None:
+                    if user_id in self._wallet_cache:
+                        self._wallet_cache[user_id] += MONEY_PER_MESSAGE
+                else:
+                    self._wallet_cache.pop(user_id, None)
+
+    async def _flush_loop(self):
+        """Debounced background flush of queued credits"""
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush_pending()
+
+    def start_flushing(self):
+        """Start the background flush task (idempotent)"""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        """Flush anything still queued, then close the connection"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self.conn is not None:
+            await self.flush_pending()
+            await self.conn.close()
+            self.conn = None
+
 # Initialize the money system
 money_system = MoneyBot()
 
+# Embeds built once at import: the help embed is fully static, and the
+# balance embed is a template whose title/field are patched per call
+# instead of re-running the whole Embed construction dance.
+if DAILY_LIMIT is None:
+    _EARN_BLURB = "Earn $5 for every message you send - no limits!"
+    _EARN_RULE = "• Unlimited earning from regular chat messages"
+else:
+    _EARN_BLURB = f"Earn $5 for every message you send - up to ${DAILY_LIMIT:,} per day!"
+    _EARN_RULE = f"• Earn up to ${DAILY_LIMIT:,} per day from regular chat messages"
+
+HELP_EMBED = discord.Embed(title="💰 Money System Commands", color=0xffd700)
+HELP_EMBED.description = _EARN_BLURB
+HELP_EMBED.add_field(name="!balance", value="Check your wallet balance (only in #money channel)", inline=False)
+HELP_EMBED.add_field(name="Rules", value=f"• No money earned in #money channel\n• No money for using commands\n{_EARN_RULE}", inline=False)
+HELP_EMBED.set_footer(text="💡 Tip: Just keep chatting in other channels to earn money!")
+
+BALANCE_EMBED = discord.Embed(color=0x00ff00)
+BALANCE_EMBED.add_field(name="🪙 Balance", value="", inline=True)
+
+# Health-check endpoint for the hosting platform's liveness probes.
+# Served from the bot's own event loop so probes don't need a dedicated
+# thread (and its stack) contending on the GIL.
+health_runner = None
+
+async def _health(request):
+    return web.Response(text="Bot is alive!")
+
+async def start_health_server():
+    """Start the liveness endpoint on the bot's loop (idempotent)"""
+    global health_runner
+    if health_runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get('/', _health)
+    health_runner = web.AppRunner(app)
+    await health_runner.setup()
+    site = web.TCPSite(health_runner, '0.0.0.0', int(os.getenv('PORT', 8080)))
+    await site.start()
+
+async def shutdown():
+    """Graceful stop on SIGTERM: close the probe socket and disconnect.
+
+    Closing the health server first means in-flight probes finish
+    instead of getting RSTs, and the port is free immediately on
+    redeploy instead of lingering in TIME_WAIT. Queued credits are
+    flushed before the database connection is closed.
+    """
+    global health_runner
+    if health_runner is not None:
+        await health_runner.cleanup()
+        health_runner = None
+    await money_system.close()
+    await bot.close()
+
+def install_signal_handlers():
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, lambda: asyncio.create_task(shutdown()))
+    except NotImplementedError:
+        # No loop signal handlers on this platform (e.g. Windows)
+        pass
+
+def rebuild_money_channel_ids():
+    """Resolve the #money channel ids once so the message hot path can
+    do an integer set lookup instead of lowercasing channel names."""
+    bot.money_channel_ids = frozenset(
+        channel.id
+        for guild in bot.guilds
+        for channel in guild.text_channels
+        if channel.name.lower() == "money"
+    )
+
 @bot.event
 async def on_ready():
+    rebuild_money_channel_ids()
+    await money_system.start()
+    await start_health_server()
+    install_signal_handlers()
     print(f'{bot.user} has connected to Discord!')
     print('Money Bot is ready!')
 
+@bot.event
+async def on_guild_channel_create(channel):
+    rebuild_money_channel_ids()
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    rebuild_money_channel_ids()
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    rebuild_money_channel_ids()
+
 @bot.event
 async def on_message(message):
     # Don't respond to bot messages
     if message.author.bot:
         return
-    
-    # Process commands first
-    await bot.process_commands(message)
-    
-    # Don't give money for messages in #money channel
-    if message.channel.name.lower() == "money":
-        return
-    
-    # Don't give money for command messages (messages starting with !)
+
+    # Only command-shaped messages need the command dispatcher; they
+    # never earn money, so stop there
     if message.content.startswith('!'):
+        await bot.process_commands(message)
         return
-    
+
+    # Don't give money for messages in #money channel
+    if message.channel.id in bot.money_channel_ids:
+        return
+
     # Add money for regular messages in other channels
     money_system.add_money(message.author.id)
 
@@ -110,30 +362,22 @@ async def on_message(message):
 async def balance(ctx):
     """Check your wallet balance (only works in #money channel)"""
     # Check if command is used in "money" channel
-    if ctx.channel.name.lower() != "money":
+    if ctx.channel.id not in bot.money_channel_ids:
         await ctx.send("❌ This command can only be used in the #money channel!")
         return
     
-    user_data = money_system.get_user_data(ctx.author.id)
-    wallet = user_data[1]
-    
-    embed = discord.Embed(title=f"💰 {ctx.author.display_name}'s Wallet", color=0x00ff00)
-    embed.add_field(name="🪙 Balance", value=f"${wallet:,}", inline=True)
-    
+    wallet = await money_system.get_user_data(ctx.author.id)
+
+    embed = BALANCE_EMBED
+    embed.title = f"💰 {ctx.author.display_name}'s Wallet"
+    embed.set_field_at(0, name="🪙 Balance", value=f"${wallet:,}", inline=True)
+
     await ctx.send(embed=embed)
 
 @bot.command(name='help_money', aliases=['money_help'])
 async def help_money(ctx):
     """Show money system help"""
-    embed = discord.Embed(title="💰 Money System Commands", color=0xffd700)
-    embed.description = "Earn $5 for every message you send - no limits!"
-    
-    embed.add_field(name="!balance", value="Check your wallet balance (only in #money channel)", inline=False)
-    embed.add_field(name="Rules", value="• No money earned in #money channel\n• No money for using commands\n• Unlimited earning from regular chat messages", inline=False)
-    
-    embed.set_footer(text="💡 Tip: Just keep chatting in other channels to earn unlimited money!")
-    
-    await ctx.send(embed=embed)
+    await ctx.send(embed=HELP_EMBED)
 
 # Get token from environment variable
 if __name__ == "__main__":